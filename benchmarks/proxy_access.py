@@ -0,0 +1,137 @@
+"""
+Microbenchmark for util.proxy()-generated accessors.
+
+Compares attribute access through the generated properties against
+the ones util.proxy() used to install -- functools.partial-based for
+proxied slots and transformative_partial-based for proxied properties
+-- and times a cold `import whatgif` in a fresh interpreter with each.
+
+Run from the repo root:
+    python benchmarks/proxy_access.py
+"""
+import inspect
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from functools import partial, wraps
+from operator import attrgetter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from whatgif import classes, util  # noqa: E402
+
+
+# util.proxy() as it was before accessors were generated directly
+def _legacy_proxy(*what, **kwargs):
+    what = set(map(str.casefold, what))
+    slots, properties = 'slots' in what, 'properties' in what
+    def inner(cls):
+        for attr_name, attr_cls in kwargs.items():
+            if properties:
+                for proxied_prop_name, proxied_prop in inspect.getmembers(attr_cls, property.__instancecheck__):
+                    setattr(cls, proxied_prop_name, property(
+                        transformative_partial(proxied_prop.__get__, attrgetter(attr_name)),
+                        transformative_partial(proxied_prop.__set__, attrgetter(attr_name), None),
+                        transformative_partial(proxied_prop.__delete__, attrgetter(attr_name))
+                    ))
+            if slots:
+                for proxied_attr in getattr(attr_cls, '__slots__', ()):
+                    setattr(cls, proxied_attr, property(
+                      partial(_legacy_getf, attr_name, proxied_attr),
+                      partial(_legacy_setf, attr_name, proxied_attr),
+                      partial(_legacy_delf, attr_name, proxied_attr),
+                    ))
+        return cls
+    return inner
+
+
+def transformative_partial(func, *transformers, **kw_transformers):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        args = [
+          arg if transformer is None else transformer(arg)
+          for transformer, arg in zip(transformers, args)
+        ]
+        kwargs = {
+          name: arg if transformer is None else transformer(arg)
+          for transformer, name, arg in zip(kw_transformers, kwargs.keys(), kwargs.values())
+        }
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _legacy_getf(attr_name, proxied_attr, self):
+    return getattr(getattr(self, attr_name), proxied_attr)
+
+
+def _legacy_setf(attr_name, proxied_attr, self, value):
+    setattr(getattr(self, attr_name), proxied_attr, value)
+
+
+def _legacy_delf(attr_name, proxied_attr, self):
+    delattr(getattr(self, attr_name), proxied_attr)
+
+
+_LEGACY_SOURCES = (_legacy_proxy, transformative_partial, _legacy_getf, _legacy_setf, _legacy_delf)
+
+
+class _Holder:
+    __slots__ = 'image_descriptor', 'gce'
+
+    def __init__(self):
+        self.image_descriptor = classes.ImageDescriptor(10, 10)
+        self.gce = classes.GraphicControlExtension(0, 0)
+
+
+def _holder(name, decorator):
+    cls = type(name, (_Holder,), {'__slots__': ()})
+    return decorator('slots', 'properties', image_descriptor=classes.ImageDescriptor, gce=classes.GraphicControlExtension)(cls)
+
+
+Legacy = _holder('Legacy', _legacy_proxy)
+Generated = _holder('Generated', util.proxy)
+
+
+def bench_access(number=1_000_000):
+    # a proxied slot, and a proxied property (itself proxied from the GCE's packed field)
+    for attr, value in (('left', '1'), ('disposal_method', "'replace'")):
+        for cls in (Legacy, Generated):
+            obj = cls()
+            get = min(timeit.repeat('obj.' + attr, globals={'obj': obj}, number=number, repeat=5))
+            set_ = min(timeit.repeat('obj.{} = {}'.format(attr, value), globals={'obj': obj}, number=number, repeat=5))
+            print('{:<10} {:<16} get {:6.1f} ns   set {:6.1f} ns'.format(
+              cls.__name__, attr, 1e9 * get / number, 1e9 * set_ / number
+            ))
+
+
+def _time_import(root, repeat):
+    # numpy is imported first so that only whatgif's own cost is measured
+    code = (
+      'import time, numpy; t = time.perf_counter(); import whatgif;'
+      'print(time.perf_counter() - t)'
+    )
+    return min(
+      float(subprocess.check_output([sys.executable, '-c', code], cwd=root))
+      for _ in range(repeat)
+    )
+
+
+def bench_import(repeat=10):
+    # the baseline is this same tree with util.proxy swapped for the legacy one
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(ROOT, 'whatgif'), os.path.join(tmp, 'whatgif'), ignore=shutil.ignore_patterns('__pycache__'))
+        with open(os.path.join(tmp, 'whatgif', 'util.py'), 'a') as f:
+            f.write('\n\nimport inspect\nfrom functools import partial, wraps\n\n\n')
+            f.write('\n\n'.join(inspect.getsource(func) for func in _LEGACY_SOURCES))
+            f.write('\n\nproxy = _legacy_proxy\n')
+        for name, root in (('Legacy', tmp), ('Generated', ROOT)):
+            print('{:<10} import whatgif    {:6.2f} ms (best of {})'.format(name, 1e3 * _time_import(root, repeat), repeat))
+
+
+if __name__ == '__main__':
+    bench_access()
+    bench_import()
@@ -0,0 +1,129 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+from whatgif import core
+
+
+def walk(data):
+    """
+    Parses the block structure of a serialized GIF, checking that every
+    declared length lines up with the bytes actually written.
+    Returns (logical screen descriptor fields, list of (kind, info)).
+    """
+    assert data[:6] == b'GIF89a'
+    width, height, field, background, aspect = struct.unpack('<HHBBB', data[6:13])
+    pos = 13
+    if field & 0x80:
+        pos += 3 * 2 ** ((field & 0x07) + 1)
+    blocks = []
+    while True:
+        introducer = data[pos]
+        if introducer == 0x3b:
+            assert pos == len(data) - 1, 'bytes after the trailer'
+            break
+        if introducer == 0x21:
+            label = data[pos+1]
+            pos += 2
+            if label == 0xf9:
+                assert data[pos] == 4
+                packed, delay, transparent = struct.unpack('<BHB', data[pos+1:pos+5])
+                blocks.append(('gce', (packed, delay, transparent)))
+            else:
+                blocks.append(('extension', label))
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        elif introducer == 0x2c:
+            left, top, w, h, packed = struct.unpack('<HHHHB', data[pos+1:pos+10])
+            pos += 10
+            if packed & 0x80:
+                pos += 3 * 2 ** ((packed & 0x07) + 1)
+            blocks.append(('image', (left, top, w, h)))
+            pos += 1  # LZW minimum code size
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        else:
+            raise AssertionError('unexpected byte {:#04x} at {}'.format(introducer, pos))
+    return (width, height, field, background, aspect), blocks
+
+
+def _frame(n_colors, shape=(8, 8)):
+    colors = np.array([(idx, 255 - idx, idx // 2) for idx in range(n_colors)], dtype=np.uint8)
+    return colors[np.arange(shape[0] * shape[1]).reshape(shape) % n_colors]
+
+
+@pytest.mark.parametrize('n_colors', [1, 2, 3, 4, 7, 8, 16, 127, 128, 255])
+def test_global_table_size_matches_bytes_written(n_colors):
+    gif = core.GIF()
+    gif.background_color_index = 0
+    gif.append(_frame(n_colors, (16, 16)))
+    lsd, blocks = walk(bytes(gif))
+    assert lsd[:2] == (16, 16)
+    assert [kind for kind, _ in blocks].count('image') == 1
+    # the transparent index must fall within the declared table
+    declared = 2 ** ((lsd[2] & 0x07) + 1)
+    assert all(info[2] < declared for kind, info in blocks if kind == 'gce')
+
+
+def _delays(blocks):
+    """
+    Returns the delay each image is shown for, per its preceding GCE
+    """
+    delays, pending = [], 0
+    for kind, info in blocks:
+        if kind == 'gce':
+            pending = info[1]
+        elif kind == 'image':
+            delays.append(pending)
+            pending = 0
+    return delays
+
+
+def test_every_frame_carries_the_global_delay():
+    gif = core.GIF(delay_time=7)
+    gif.background_color_index = 0
+    for n_colors in (2, 3, 4, 5, 6):
+        gif.append(_frame(n_colors))
+    _, blocks = walk(bytes(gif))
+    assert _delays(blocks) == [7] * 5
+
+
+def test_appended_frames_carry_the_global_delay():
+    gif = core.GIF(delay_time=4, color_table_capacity=16)
+    gif.background_color_index = 0
+    gif.append(_frame(2))
+    file = io.BytesIO(bytes(gif))
+    for n_colors in (3, 4, 5):
+        gif.append(_frame(n_colors))
+        gif.append_to(file)
+    _, blocks = walk(file.getvalue())
+    assert _delays(blocks) == [4] * 4
+
+
+@pytest.mark.parametrize('n_colors', [1, 2, 5])
+def test_streamed_image_table_size_matches_bytes_written(n_colors):
+    file = io.BytesIO()
+    written = core.stream_image(file, _frame(n_colors, (40, 10)), 10, 40, band_rows=16)
+    lsd, blocks = walk(file.getvalue())
+    assert written == len(file.getvalue())
+    assert lsd[:2] == (10, 40)
+    assert [kind for kind, _ in blocks] == ['image']
+
+
+def test_fit_to_budget_keeps_logical_screen_descriptor_fields():
+    gif = core.GIF(delay_time=3)
+    gif.background_color_index = 1
+    gif.pixel_aspect_ratio = 49
+    gif.color_resolution = 7
+    for n_colors in (2, 3, 4, 5):
+        gif.append(_frame(n_colors))
+    gif.fit_to_budget(10 ** 6)
+    lsd, blocks = walk(bytes(gif))
+    assert lsd[0:2] == (8, 8)
+    assert lsd[2] >> 4 & 0x07 == 7
+    assert lsd[3:] == (1, 49)
+    assert _delays(blocks) == [3] * 4
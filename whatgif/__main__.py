@@ -0,0 +1,178 @@
+"""
+Batch-converts .npy frame stacks to GIFs across a pool of worker processes.
+
+    python -m whatgif [options] INPUT [INPUT ...]
+
+Each input is a .npy file holding either a single (height, width, 3)
+frame or a (frames, height, width, 3) stack of uint8 RGB frames, or a
+directory whose .npy files are all converted.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from . import classes, core
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m whatgif', description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('inputs', nargs='+', metavar='INPUT', help='.npy frame stack or directory of them')
+    parser.add_argument('-o', '--output-dir', help='where to write GIFs (default: alongside each input)')
+    parser.add_argument('-d', '--delay', type=int, default=0, help='frame delay in hundredths of a second')
+    parser.add_argument('-l', '--loop', type=int, default=0, help='loop count (0 loops forever)')
+    parser.add_argument('--diff', action='store_true', help='difference-compress consecutive frames')
+    parser.add_argument(
+      '--tolerance', type=int, default=0,
+      help='max difference under which --diff treats a pixel as unchanged'
+    )
+    parser.add_argument(
+      '--metric', choices=('channel', 'perceptual'), default='channel',
+      help='how --tolerance measures difference: per-channel delta or perceptual distance'
+    )
+    parser.add_argument(
+      '--disposal', action='store_true',
+      help='with --diff, pick each frame\'s disposal method by estimated size'
+    )
+    parser.add_argument(
+      '--tile-size', type=int,
+      help='with --diff, split frames whose changes are far apart into rectangles on this pixel grid'
+    )
+    parser.add_argument(
+      '--max-bytes', type=int,
+      help='lower quality (tolerance, color depth, frame rate) as needed to fit this size; implies --diff'
+    )
+    parser.add_argument(
+      '--palette', choices=('global', 'local'), default='global',
+      help='one color table shared by all frames, or one per frame'
+    )
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    args = parser.parse_args(argv)
+    # rate control picks its own tolerance
+    if args.max_bytes is not None and args.tolerance:
+        parser.error('--tolerance cannot be combined with --max-bytes')
+    if args.tile_size is not None:
+        if args.max_bytes is not None:
+            parser.error('--tile-size cannot be combined with --max-bytes')
+        if not args.diff:
+            parser.error('--tile-size requires --diff')
+    if args.disposal:
+        if args.max_bytes is not None:
+            parser.error('--disposal cannot be combined with --max-bytes')
+        if not args.diff:
+            parser.error('--disposal requires --diff')
+        if args.tile_size is not None:
+            parser.error('--disposal cannot be combined with --tile-size')
+    return args
+
+
+def collect_inputs(inputs):
+    for path in inputs:
+        if os.path.isdir(path):
+            yield from sorted(
+              os.path.join(path, name)
+              for name in os.listdir(path)
+              if name.endswith('.npy')
+            )
+        else:
+            yield path
+
+
+def output_path(path, output_dir=None):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir or os.path.dirname(path), stem + '.gif')
+
+
+def convert(
+  path, out_path, *,
+  delay=0, loop=0, diff=False, tolerance=0, metric='channel', disposal=False, tile_size=None,
+  max_bytes=None, palette='global'
+):
+    """
+    Converts the .npy frame stack at `path` to a GIF at `out_path`.
+    Returns (frame count, bytes written).
+    """
+    stack = np.load(path, mmap_mode='r')
+    if stack.ndim == 3:
+        stack = stack[np.newaxis]
+    if stack.ndim != 4 or stack.shape[-1] != 3:
+        raise ValueError('Expected (frames, height, width, 3) RGB array, got shape {}'.format(stack.shape))
+    gif = core.GIF(loop, delay_time=delay)
+    gif.background_color_index = 0
+    if palette == 'local':
+        gif.has_global_color_table = False
+        gif.global_color_table_size = 0
+    for pixels in stack:
+        pixels = np.asarray(pixels)
+        if palette == 'local':
+            gif.append(core.Frame(pixels, gif, color_table=classes.ColorTable(), delay_time=delay))
+        else:
+            gif.append(pixels)
+    tables = [gif.global_color_table, *(frame.color_table for frame in gif)]
+    if max_bytes is None and any(table.size() > 7 for table in tables):
+        # only rate control reduces colors
+        raise ValueError('Too many colors for a GIF (at most 255 per color table); try --max-bytes')
+    if max_bytes is not None:
+        gif.fit_to_budget(max_bytes, metric=metric)
+    elif diff and disposal:
+        gif.optimize_disposal(tolerance, metric)
+    elif diff:
+        gif.difference_compress(tolerance, metric, tile_size)
+    # encode before opening so that failures don't leave a truncated file behind
+    blocks = gif.blocks()
+    fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        written = gif.writev(fd, blocks=blocks)
+    finally:
+        os.close(fd)
+    return len(stack), written
+
+
+def _timed_convert(path, out_path, kwargs):
+    start = time.perf_counter()
+    frames, written = convert(path, out_path, **kwargs)
+    return frames, written, time.perf_counter() - start
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    kwargs = dict(
+      delay=args.delay, loop=args.loop, diff=args.diff,
+      tolerance=args.tolerance, metric=args.metric, disposal=args.disposal, tile_size=args.tile_size,
+      max_bytes=args.max_bytes, palette=args.palette
+    )
+    failures = total_frames = total_bytes = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+          pool.submit(_timed_convert, path, output_path(path, args.output_dir), kwargs): path
+          for path in collect_inputs(args.inputs)
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                frames, written, elapsed = future.result()
+            except Exception as e:
+                failures += 1
+                print('FAIL {}: {.__class__.__name__}: {}'.format(path, e, e), file=sys.stderr)
+                continue
+            total_frames += frames
+            total_bytes += written
+            print('ok   {}: {} frames, {} bytes in {:.2f}s ({:.1f} frames/s)'.format(
+              path, frames, written, elapsed, frames / elapsed if elapsed else float('inf')
+            ))
+    elapsed = time.perf_counter() - start
+    print('{} files ({} failed), {} frames, {} bytes in {:.2f}s ({:.1f} frames/s)'.format(
+      len(futures), failures, total_frames, total_bytes, elapsed,
+      total_frames / elapsed if elapsed else float('inf')
+    ))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
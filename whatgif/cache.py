@@ -0,0 +1,118 @@
+import hashlib
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EncodedFrameCache:
+    """
+    Thread-safe, content-addressed LRU cache of frames' LZW-encoded
+    image data, bounded by the total length of the cached data.
+    Keys come from `key()`; `hits` and `misses` count lookups.
+    """
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """
+        Total length in bytes of all cached data
+        """
+        return self._size
+
+    @staticmethod
+    def key(color_indices, color_table, geometry) -> bytes:
+        """
+        Digest of everything that determines a frame's encoded image
+        data: its color indices, its color table, and its
+        (left, top, width, height)
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(struct.pack('<4H', *geometry))
+        digest.update(bytes(color_table))
+        digest.update(np.ascontiguousarray(color_indices, dtype='<u2').tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Returns the data cached under `key`, or None
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        Caches `data` under `key`, evicting least-recently-used entries
+        as needed to stay within `max_bytes`
+        """
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_or_encode(self, key, encode):
+        """
+        Returns the data cached under `key`, calling `encode()` to
+        produce (and cache) it on a miss. Encoding happens outside the
+        lock, so two threads missing on the same key may both encode.
+        """
+        data = self.get(key)
+        if data is None:
+            data = encode()
+            self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+
+
+_active = None
+
+
+def enable(max_bytes: int = 64 * 2**20) -> EncodedFrameCache:
+    """
+    Turns on process-wide caching of encoded frames (see
+    core.Frame.blocks()), replacing any cache already active.
+    Returns the new cache.
+    """
+    global _active
+    _active = EncodedFrameCache(max_bytes)
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    """
+    Returns the process-wide EncodedFrameCache, or None if disabled
+    """
+    return _active
@@ -176,12 +176,20 @@ class ColorTable:
     `_ensure_transparent` indicates whether to ensure that there
     is always room for an extra transparent color -- that is, to
     ensure that the table always an unused color slot.
+
+    `capacity`, if given, fixes the table's length (a power of 2
+    from 2 to 256) regardless of how many colors it holds, so that
+    its size -- and with it the LZW minimum code size of any image
+    using it -- never changes as colors are added.
     """
     TRANSPARENT = object()
 
-    __slots__ = '_ensure_transparent', '_od', '_li', '_len'
+    __slots__ = '_ensure_transparent', '_od', '_li', '_len', '_capacity'
 
-    def __init__(self, iterable=()):
+    def __init__(self, iterable=(), *, capacity: int = None):
+        if capacity is not None and not (2 <= capacity <= 256 and util.is_po2(capacity)):
+            raise ValueError('Color-table capacity must be a power of 2 from 2 to 256, not {}'.format(capacity))
+        self._capacity = capacity
         self._ensure_transparent = False
         self._od = OrderedDict()
         self._li = []
@@ -210,13 +218,21 @@ class ColorTable:
         return int(2 ** (1 + self.size()))
     
     def _length(self):
+        if self._capacity is not None:
+            return self._capacity
         length = self.underlying_length()
         return length if util.is_po2(length) else util.next_po2(1 + length)
     
     @property
     def _size_offset(self):
+        if self._capacity is not None:
+            return 0
         return int(self._ensure_transparent and self.underlying_length() == self._length())
     
+    @property
+    def capacity(self):
+        return self._capacity
+    
     def size(self):
         # self._length() == (2 ** size + 1)
         # _size_offset is there to ensure there will be a transparent color
@@ -237,6 +253,8 @@ class ColorTable:
             raise ValueError('Color {} already exists with code {}'.format(
               color, self[color]
             ))
+        if self._capacity is not None and self._free_slots() < 1:
+            raise ValueError('Color table is full (capacity {})'.format(self._capacity))
         self._od[color] = next(self._len)
         self._li.append(color)
     
@@ -244,6 +262,19 @@ class ColorTable:
         for v in list(colors) if colors is self else colors:
             self.append(v)
     
+    def reorder(self, order):
+        """
+        Renumbers the table's colors so that the color at index
+        `order[i]` ends up at index i. `order` must be a permutation
+        of range(self.underlying_length()).
+        """
+        order = list(order)
+        if sorted(order) != list(range(self.underlying_length())):
+            raise ValueError('Reordering must be a permutation of the existing indices')
+        self._li = [self._li[idx] for idx in order]
+        self._od = OrderedDict(zip(self._li, count()))
+        self._len = count(len(self._li))
+    
     @property
     def transparent_color_index(self):
         self.ensure_transparent_color()
@@ -254,7 +285,12 @@ class ColorTable:
         yield from self._od
     
     def ensure_transparent_color(self):
+        if not self._ensure_transparent and self._capacity is not None and self._free_slots() < 1:
+            raise ValueError('Color table is full (capacity {})'.format(self._capacity))
         self._ensure_transparent = True
+    
+    def _free_slots(self):
+        return self._capacity - self.underlying_length() - self._ensure_transparent
 
 
 @util.proxy('slots', color_field=ImageColorField)
@@ -333,13 +369,13 @@ class GraphicControlExtension(Extension):
         self.transparent_color_index = transparent_color_index
     
     def __bytes__(self):
-        return super().__bytes__() + bytearray([
-          0x04,
+        return super().__bytes__() + struct.pack(
+          '<BHBB',
           int(self.field),
           self.delay_time,
           self.transparent_color_index,
-          0x00
-        ])
+          0x00  # block terminator
+        )
 
 
 class ApplicationExtension(Extension):
@@ -1,10 +1,36 @@
+import copy
 import struct
+import tempfile
 from collections import namedtuple
 from collections.abc import MutableSequence
 
 import numpy as np
 
-from . import classes, lzw, util
+from . import cache, classes, lzw, util
+
+
+RateSettings = namedtuple('RateSettings', 'tolerance color_bits decimation')
+RateSettings.__doc__ = """
+Knobs turned by GIF.fit_to_budget():
+    tolerance: passed to difference_compress()
+    color_bits: bits kept per RGB channel (8 keeps colors as-is)
+    decimation: keep every nth frame, folding the others' delays into it
+"""
+
+RATE_LADDER = (
+  RateSettings(0, 8, 1),
+  RateSettings(2, 8, 1),
+  RateSettings(4, 8, 1),
+  RateSettings(4, 7, 1),
+  RateSettings(8, 7, 1),
+  RateSettings(8, 6, 1),
+  RateSettings(16, 6, 1),
+  RateSettings(16, 5, 1),
+  RateSettings(16, 5, 2),
+  RateSettings(24, 4, 2),
+  RateSettings(32, 4, 3),
+  RateSettings(32, 3, 4),
+)
 
 
 @util.proxy('slots', 'properties', logical_screen_descriptor=classes.LogicalScreenDescriptor)
@@ -22,27 +48,229 @@ class GIF(MutableSequence):
       *,
       delay_time: int = 0,
       canvas_width: int = None,
-      canvas_height: int = None
+      canvas_height: int = None,
+      color_table_capacity: int = None
     ):
         self.header = classes.Header()
         self.logical_screen_descriptor = classes.LogicalScreenDescriptor(canvas_width, canvas_height)
-        self.global_color_table = classes.ColorTable()
+        self.global_color_table = classes.ColorTable(capacity=color_table_capacity)
         self.netscape_looping_extension = classes.NetscapeApplicationExtension(loop_count)
         
         self.images = []
         self.global_delay_time = delay_time
     
+    @classmethod
+    def from_file(cls, file, *, delay_time: int = 0):
+        """
+        Rebuilds a GIF, with no frames, from the header, logical screen
+        descriptor, global color table and looping extension of the GIF
+        in the seekable binary `file`, so that `append_to()` can carry
+        on writing to it e.g. from another process.
+        The global color table's capacity is taken to be its size in
+        the file. Since unused slots are padded with black, trailing
+        black entries are ambiguous: at most one of them is kept as a
+        color, and a black last slot is taken to be the transparent
+        color's.
+        """
+        file.seek(0)
+        header, lsd = file.read(6), file.read(7)
+        if len(lsd) < 7 or header[:3] != b'GIF':
+            raise ValueError('File does not start with a GIF header')
+        canvas_width, canvas_height, field, background_color_index, pixel_aspect_ratio = struct.unpack('<HHBBB', lsd)
+        if not field & 0x80:
+            raise ValueError('Resuming a GIF requires it to have a global color table')
+        capacity = 2 ** ((field & 0x07) + 1)
+        data = file.read(3 * capacity)
+        if len(data) < 3 * capacity:
+            raise ValueError('File ends within its global color table')
+        colors = [tuple(data[idx:idx+3]) for idx in range(0, len(data), 3)]
+        transparent = colors[-1] == (0, 0, 0)
+        if transparent:
+            colors.pop()
+        padded = False
+        while colors and colors[-1] == (0, 0, 0):
+            colors.pop()
+            padded = True
+        # a black color would have been the first slot after the rest
+        if padded and (0, 0, 0) not in colors:
+            colors.append((0, 0, 0))
+        loop_count = 0
+        extension = file.read(19)
+        if extension[:14] == b'\x21\xff\x0bNETSCAPE2.0':
+            loop_count, = struct.unpack('<H', extension[16:18])
+        
+        gif = cls(
+          loop_count,
+          delay_time=delay_time,
+          canvas_width=canvas_width,
+          canvas_height=canvas_height,
+          color_table_capacity=capacity
+        )
+        gif.header = classes.Header(header[3:])
+        gif.color_resolution = field >> 4 & 0x07
+        gif.sort = bool(field & 0x08)
+        gif.background_color_index = background_color_index
+        gif.pixel_aspect_ratio = pixel_aspect_ratio
+        gif.global_color_table.extend(colors)
+        if transparent:
+            gif.global_color_table.ensure_transparent_color()
+        gif.update_color_table_size()
+        return gif
+    
     def __bytes__(self):
+        return b''.join(self.blocks())
+    
+    def blocks(self) -> list:
+        """
+        Serializes each block of the GIF (frames contributing several)
+        without joining them, so they can be sized up front and then
+        written out with `write_into()` or `writev()`.
+        """
+        blocks = self._header_blocks()
+        for frame in self:
+            blocks.extend(frame.blocks())
+        blocks.append(b'\x3b')
+        return blocks
+    
+    def _header_blocks(self) -> list:
         if self:
             self[0].use_graphic_control_extension = True
-        return b''.join(map(bytes, [
-          self.header,
-          self.logical_screen_descriptor,
-          self.global_color_table,
-          self.netscape_looping_extension,
-          *self,
-          b'\x3b'
-        ]))
+        blocks = [bytes(self.header), bytes(self.logical_screen_descriptor)]
+        if self.has_global_color_table:
+            blocks.append(bytes(self.global_color_table))
+        blocks.append(bytes(self.netscape_looping_extension))
+        return blocks
+    
+    def estimate_size(self) -> int:
+        """
+        Returns the exact length of bytes(self), with frames' image
+        data LZW-encoded in dry-run mode (codes are counted rather
+        than written out)
+        """
+        return util.blocks_size(self._header_blocks()) + sum(frame.estimate_size() for frame in self) + 1
+    
+    def fit_to_budget(self, max_bytes, ladder=None, *, metric='channel'):
+        """
+        Rebuilds this GIF's frames under the highest-quality settings
+        in `ladder` (default: RATE_LADDER) whose output fits within
+        `max_bytes`, and returns those settings.
+        `ladder` is a sequence of RateSettings ordered from highest to
+        lowest quality, i.e. assumed to produce ever-smaller output, and
+        is binary-searched; only about log2(len(ladder)) + 1 estimation
+        passes are made.
+        Frames with a local color table get a fresh one of their own
+        in every trial, and the rest share a new global one.
+        Frames must not have been difference-compressed or cropped
+        already. Raises ValueError, leaving the GIF untouched, if even
+        the last settings don't fit.
+        """
+        if ladder is None:
+            ladder = RATE_LADDER
+        sources = []
+        for frame in self:
+            if (frame.left, frame.top, frame.width, frame.height) != (0, 0, self.canvas_width, self.canvas_height):
+                raise ValueError('Cannot rate-control frames that are already cropped')
+            sources.append((frame.pixels, frame.delay_time, frame._color_table is not None))
+        best = None
+        lo, hi = 0, len(ladder) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            trial = self._rate_trial(sources, ladder[mid], metric)
+            # more than 256 colors can't be represented at all
+            tables = [trial.global_color_table, *(frame._color_table for frame in trial if frame._color_table is not None)]
+            if all(table.size() <= 7 for table in tables) and trial.estimate_size() <= max_bytes:
+                best = mid, trial
+                hi = mid - 1
+            else:
+                lo = mid + 1
+        if best is None:
+            raise ValueError('Cannot fit GIF within {} bytes even with {}'.format(max_bytes, ladder[-1]))
+        idx, trial = best
+        # the rest of the logical screen descriptor is the caller's to keep
+        self.canvas_width, self.canvas_height = trial.canvas_width, trial.canvas_height
+        self.global_color_table_size, self.sort = trial.global_color_table_size, trial.sort
+        self.global_color_table = trial.global_color_table
+        self.images = trial.images
+        for frame in self:
+            frame.gif = self
+        return ladder[idx]
+    
+    def _rate_trial(self, sources, settings, metric):
+        trial = GIF(self.netscape_looping_extension.loop_count, delay_time=self.global_delay_time)
+        trial.background_color_index = self.background_color_index
+        trial.has_global_color_table = self.has_global_color_table
+        # low bits are replaced with the middle of their range rather than zeroed
+        keep = 0xff << (8 - settings.color_bits) & 0xff
+        half = (1 << (7 - settings.color_bits)) if settings.color_bits < 8 else 0
+        for idx in range(0, len(sources), settings.decimation):
+            group = sources[idx:idx+settings.decimation]
+            pixels, _, local = group[0]
+            if half:
+                pixels = pixels & keep | half
+            delay_time = min(0xffff, sum(delay_time for _, delay_time, _ in group))
+            if local:
+                # a fresh local table per frame, like the source frame had
+                trial.append(Frame(pixels, trial, color_table=classes.ColorTable(), delay_time=delay_time))
+            else:
+                trial.append(trial.create_frame(pixels, delay_time))
+        if not trial.has_global_color_table:
+            trial.global_color_table_size = 0
+        trial.difference_compress(settings.tolerance, metric)
+        return trial
+    
+    def write_into(self, buffer, offset=0, *, blocks=None) -> int:
+        """
+        Writes the GIF into the preallocated writable `buffer` at `offset`.
+        `blocks` may be passed if already obtained from `blocks()`, e.g.
+        to size the buffer with `util.blocks_size()` beforehand.
+        Returns the number of bytes written.
+        """
+        if blocks is None:
+            blocks = self.blocks()
+        return util.write_blocks_into(blocks, buffer, offset)
+    
+    def writev(self, fd, *, blocks=None) -> int:
+        """
+        Writes the GIF to the file descriptor `fd` with a single
+        vectored write (barring partial writes) of all its blocks.
+        Returns the number of bytes written.
+        """
+        if blocks is None:
+            blocks = self.blocks()
+        return util.writev_blocks(fd, blocks)
+    
+    def append_to(self, file, start=-1) -> int:
+        """
+        Appends frames `self[start:]` (by default just the last one) to
+        `file`, a seekable binary file opened in r+b mode that holds
+        this GIF as written so far, in place of its trailer.
+        The logical screen descriptor and global color table are
+        rewritten in place too, in case new colors have since been
+        added, so the GIF must have been created with a fixed
+        `color_table_capacity` -- otherwise the table's size, and with
+        it every earlier frame's LZW code size, could have changed.
+        Nothing else about frames already in the file is needed, so
+        they can be deleted from the GIF (e.g. `del gif[:]`) once
+        written to keep memory flat; to carry on in a fresh process,
+        use `GIF.from_file()`.
+        Returns the number of bytes written.
+        """
+        if self.global_color_table.capacity is None:
+            raise ValueError('Appending to a file requires a GIF created with color_table_capacity')
+        file.seek(-1, 2)
+        if file.read(1) != b'\x3b':
+            raise ValueError('File does not end with a GIF trailer')
+        # header is fixed-size and both of these are fixed-size given a capacity
+        file.seek(len(bytes(self.header)))
+        file.write(bytes(self.logical_screen_descriptor))
+        file.write(bytes(self.global_color_table))
+        file.seek(-1, 2)
+        blocks = [block for frame in self[start:] for block in frame.blocks()]
+        blocks.append(b'\x3b')
+        for block in blocks:
+            file.write(block)
+        file.flush()
+        return util.blocks_size(blocks)
     
     def __getitem__(self, idx):
         return self.images.__getitem__(idx)
@@ -65,16 +293,15 @@ class GIF(MutableSequence):
         self.update_dims(value.image_descriptor)
         self.images.insert(idx, value)
     
-    def create_frame(self, pixels, delay_time=None, *, transparent_color_index=None):
+    def create_frame(self, pixels, delay_time=None, *, transparent_color_index=None, unique_colors=None):
         use_graphic_control_extension = False
         
         if delay_time is None:
             delay_time = self.global_delay_time
         elif delay_time != self.global_delay_time:
             use_graphic_control_extension = True
-        if transparent_color_index is None:
-            transparent_color_index = self.global_color_table.transparent_color_index
-        elif transparent_color_index != self.global_color_table.transparent_color_index:
+        # None is resolved by the frame itself, once its colors are in the table
+        if transparent_color_index is not None and transparent_color_index != self.global_color_table.transparent_color_index:
             use_graphic_control_extension = True
         
         return Frame(
@@ -82,7 +309,8 @@ class GIF(MutableSequence):
           self,
           delay_time=delay_time,
           transparent_color_index=transparent_color_index,
-          use_graphic_control_extension=use_graphic_control_extension
+          use_graphic_control_extension=use_graphic_control_extension,
+          unique_colors=unique_colors
         )
     
     def update_dims(self, image_descriptor):
@@ -92,12 +320,477 @@ class GIF(MutableSequence):
     def update_color_table_size(self):
         self.global_color_table_size = self.global_color_table.size()
     
-    def difference_compress(self):
+    def reorder_palette(self, method='frequency'):
+        """
+        Renumbers the global color table, remapping every frame that
+        uses it with a single lookup table. `method` is one of:
+            'frequency': most-used colors first (also sets the table's
+              sort flag, which is what the spec intends it for)
+            'luminance': darkest to lightest
+            'adjacency': greedily chains together colors that most often
+              sit side by side horizontally
+        Returns the lookup table, mapping old indices to new ones.
+        """
+        table = self.global_color_table
+        n = table.underlying_length()
+        frames = [frame for frame in self if frame._color_table is None]
+        if method == 'frequency':
+            counts = np.zeros(n, dtype=np.int64)
+            for frame in frames:
+                counts += np.bincount(frame.color_indices[frame.color_indices >= 0], minlength=n)
+            order = np.argsort(-counts, kind='stable')
+        elif method == 'luminance':
+            colors = np.array(list(table.underlying), dtype=float).reshape(-1, 3)
+            order = np.argsort(colors @ [0.299, 0.587, 0.114], kind='stable')
+        elif method == 'adjacency':
+            order = _adjacency_order(frames, n)
+        else:
+            raise ValueError('Invalid palette-reordering method {!r}'.format(method))
+        order = [int(idx) for idx in order]
+        table.reorder(order)
+        lut = np.empty(n + 1, dtype=np.int64)
+        lut[order] = np.arange(n)
+        # the extra slot makes ColorTable.TRANSPARENT's placeholder index of -1 map to itself
+        lut[-1] = table[classes.ColorTable.TRANSPARENT]
+        for frame in frames:
+            frame.color_indices = lut[frame.color_indices]
+        self.sort = method == 'frequency'
+        return lut[:-1]
+    
+    def difference_compress(self, tolerance=0, metric='channel', tile_size=None):
+        """
+        Makes each frame's pixels that are within `tolerance` (see
+        `unchanged_mask()`) of what's already on the canvas transparent,
+        then crops the frame down to the rest.
+        Frames are compared against the canvas as it'll actually be
+        displayed -- i.e. with near-matches carried forward rather than
+        replaced -- so that error can't accumulate across frames.
+        If `tile_size` is given, frames whose changes lie in separate
+        regions are then split up with `Frame.split(tile_size)`.
+        """
         if not self:
             return
-        prev = self[0]
-        for cur in self[1:]:
-            prev %= cur
+        canvas = Canvas(self.canvas_width, self.canvas_height, self[0].pixels.dtype)
+        for frame in self:
+            canvas.difference_compress(frame, tolerance, metric)
+        if tile_size is not None:
+            self.images = [part for frame in self for part in frame.split(tile_size)]
+    
+    def optimize_disposal(self, tolerance=0, metric='channel') -> list:
+        """
+        Difference-compresses frames like `difference_compress()`, but
+        picks each frame's disposal method according to what's cheapest
+        for the frame after it, which can be diffed against:
+            'accumulate': the canvas with this frame left in place
+            'restore': the canvas as it was before this frame (good for
+              e.g. flashing overlays)
+            'replace': the canvas with this frame's area cleared, which
+              the next frame then has to redraw in full
+        For each frame, every candidate's changed region is computed and
+        its encoded size estimated (see `Frame.estimate_size()`).
+        Returns the chosen disposal methods, the last frame's being None.
+        """
+        if not self:
+            return []
+        before = Canvas(self.canvas_width, self.canvas_height, self[0].pixels.dtype)
+        after = before.copy()
+        after.difference_compress(self[0], tolerance, metric)
+        for prev, cur in zip(self, self[1:]):
+            cleared = after.copy()
+            cleared.clear(prev)
+            candidates = {'accumulate': after, 'restore': before, 'replace': cleared}
+            disposal_method = min(candidates, key=lambda method: candidates[method].diff_size(cur, tolerance, metric))
+            prev.disposal_method = disposal_method
+            prev.use_graphic_control_extension = True
+            before = candidates[disposal_method]
+            after = before.copy()
+            after.difference_compress(cur, tolerance, metric)
+        return [frame.disposal_method for frame in self]
+
+
+class Canvas:
+    """
+    Tracks what a decoder will be displaying as frames are drawn in
+    turn, so that each can be difference-compressed against it.
+    `known` marks the pixels that some frame has actually drawn.
+    """
+    def __init__(self, width, height, dtype=np.uint8):
+        self.pixels = np.zeros((height, width, 3), dtype=dtype)
+        self.known = np.zeros((height, width), dtype=bool)
+    
+    @staticmethod
+    def region(frame):
+        return np.s_[frame.top:frame.top+frame.height, frame.left:frame.left+frame.width]
+    
+    def unchanged(self, frame, tolerance=0, metric='channel'):
+        """
+        Returns a mask of `frame`'s pixels that are within `tolerance`
+        of what's displayed beneath them
+        """
+        region = self.region(frame)
+        return unchanged_mask(frame.pixels, self.pixels[region], tolerance, metric) & self.known[region]
+    
+    def draw(self, frame, transparent=None):
+        """
+        Updates the canvas with `frame`, skipping pixels where the
+        `transparent` mask (if any) is True
+        """
+        region = self.region(frame)
+        where = True if transparent is None else ~transparent[..., np.newaxis]
+        np.copyto(self.pixels[region], frame.pixels, where=where)
+        self.known[region] = True
+    
+    def copy(self):
+        canvas = Canvas.__new__(Canvas)
+        canvas.pixels = self.pixels.copy()
+        canvas.known = self.known.copy()
+        return canvas
+    
+    def clear(self, frame):
+        """
+        Clears `frame`'s area, as disposing it to the background does.
+        Since what that looks like is up to the viewer, the area becomes
+        unknown rather than taking on any particular color.
+        """
+        self.known[self.region(frame)] = False
+    
+    def diff_size(self, frame, tolerance=0, metric='channel') -> int:
+        """
+        Returns the estimated encoded size of `frame` once
+        difference-compressed against this canvas, touching neither
+        """
+        mask = self.unchanged(frame, tolerance, metric)
+        if not mask.any():
+            return frame.estimate_size()
+        trial = frame.crop(0, 0, frame.height, frame.width)
+        trial.erase(mask)
+        return trial.estimate_size()
+    
+    def difference_compress(self, frame, tolerance=0, metric='channel'):
+        """
+        Draws `frame`, then erases from it whatever it didn't change
+        """
+        mask = self.unchanged(frame, tolerance, metric)
+        self.draw(frame, mask)
+        if mask.any():
+            frame.erase(mask)
+
+
+# where a bare pixel array sits on the canvas, for Canvas methods
+_Placement = namedtuple('_Placement', 'pixels left top width height')
+
+
+class SpoolingWriter:
+    """
+    Writes a GIF with a single global color table in two passes, so
+    that frames needn't be kept in memory even though the table (and
+    with it every frame's LZW code size) isn't known until the end.
+    
+    The first pass, `add()`, finds each frame's colors, maps it to
+    color indices, difference-compresses and crops it if `diff` is
+    true, and spools the indices as uint8 to `spool` (by default an
+    anonymous temporary file). The second pass, `close()`, LZW-encodes
+    every frame from the spool and writes the GIF to `file`.
+    At most 255 distinct colors are supported, the last slot being
+    reserved for transparency.
+    """
+    # stands in for ColorTable.TRANSPARENT's index in the spool
+    _TRANSPARENT = 0xff
+    
+    def __init__(self,
+      file,
+      loop_count: int = 0,
+      *,
+      delay_time: int = 0,
+      diff: bool = False,
+      tolerance: int = 0,
+      metric: str = 'channel',
+      spool=None
+    ):
+        self.file = file
+        self.gif = GIF(loop_count, delay_time=delay_time)
+        self.gif.background_color_index = 0
+        self.gif.global_color_table.ensure_transparent_color()
+        self.diff = diff
+        self.tolerance = tolerance
+        self.metric = metric
+        self._spool = tempfile.TemporaryFile() if spool is None else spool
+        self._owns_spool = spool is None
+        self._canvas = None
+        # (spool offset, left, top, width, height, delay time) per frame
+        self._records = []
+        self._closed = False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._owns_spool:
+            self._spool.close()
+    
+    def add(self, pixels, delay_time=None):
+        """
+        First pass over one frame: everything but LZW encoding
+        """
+        if self._closed:
+            raise ValueError('Cannot add frames to a closed SpoolingWriter')
+        pixels = np.asarray(pixels)
+        height, width = pixels.shape[:2]
+        if self._canvas is None:
+            self._canvas = Canvas(width, height, pixels.dtype)
+        elif (height, width) != self._canvas.known.shape:
+            raise ValueError('All frames must be {}x{}'.format(*self._canvas.known.shape[::-1]))
+        table = self.gif.global_color_table
+        colors, inverse = find_unique_colors(pixels)
+        new_colors = set(map(tuple, colors)).difference(table.underlying)
+        # checked up front so a rejected frame leaves the shared table as it was
+        if table.underlying_length() + len(new_colors) > self._TRANSPARENT:
+            raise ValueError('SpoolingWriter supports at most {} colors'.format(self._TRANSPARENT))
+        table.extend(new_colors)
+        lut = np.array([table[tuple(color)] for color in colors], dtype=np.uint8)
+        indices = lut[inverse].reshape(height, width)
+        
+        placement = _Placement(pixels, 0, 0, width, height)
+        top = left = 0
+        if self.diff:
+            mask = self._canvas.unchanged(placement, self.tolerance, self.metric)
+            self._canvas.draw(placement, mask)
+            if mask.any():
+                indices[mask] = self._TRANSPARENT
+                rows, cols = np.flatnonzero(~mask.all(1)), np.flatnonzero(~mask.all(0))
+                if not rows.size:
+                    rows = cols = np.zeros(1, dtype=int)
+                top, left = int(rows[0]), int(cols[0])
+                indices = indices[top:rows[-1]+1, left:cols[-1]+1]
+        
+        self._spool.seek(0, 2)
+        self._records.append((
+          self._spool.tell(), left, top, indices.shape[1], indices.shape[0],
+          self.gif.global_delay_time if delay_time is None else delay_time
+        ))
+        self._spool.write(np.ascontiguousarray(indices).tobytes())
+    
+    def close(self):
+        """
+        Second pass: encodes every spooled frame and writes the GIF
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if not self._records:
+                raise ValueError('Cannot write a GIF with no frames')
+            self.gif.canvas_height, self.gif.canvas_width = self._canvas.known.shape
+            self.gif.update_color_table_size()
+            table = self.gif.global_color_table
+            transparent = table.transparent_color_index
+            write = self.file.write
+            for block in self.gif._header_blocks():
+                write(block)
+            for offset, left, top, width, height, delay_time in self._records:
+                self._spool.seek(offset)
+                indices = np.frombuffer(self._spool.read(width * height), dtype=np.uint8).astype(np.intp)
+                indices[indices == self._TRANSPARENT] = transparent
+                write(bytes(classes.GraphicControlExtension(delay_time, transparent)))
+                write(bytes(classes.ImageDescriptor(width, height, left, top)))
+                write(lzw.compress(indices.tolist(), table))
+            write(b'\x3b')
+        finally:
+            if self._owns_spool:
+                self._spool.close()
+
+
+def _adjacency_order(frames, n):
+    """
+    Orders color indices 0..n-1 by starting from the most frequent one
+    and repeatedly appending whichever remaining one is most often
+    horizontally adjacent to the last
+    """
+    if not n:
+        return []
+    adjacency = np.zeros(n * n, dtype=np.int64)
+    counts = np.zeros(n, dtype=np.int64)
+    for frame in frames:
+        indices = frame.color_indices
+        left, right = indices[:, :-1], indices[:, 1:]
+        pairs = (left >= 0) & (right >= 0) & (left != right)
+        adjacency += np.bincount(left[pairs] * n + right[pairs], minlength=n * n)
+        counts += np.bincount(indices[indices >= 0], minlength=n)
+    adjacency = adjacency.reshape(n, n)
+    adjacency += adjacency.T
+    placed = np.zeros(n, dtype=bool)
+    order = [int(counts.argmax())]
+    placed[order[0]] = True
+    for _ in range(n - 1):
+        # ties (incl. no adjacency at all) fall back to frequency
+        score = np.where(placed, -1, adjacency[order[-1]] * (1 + counts.max()) + counts)
+        order.append(int(score.argmax()))
+        placed[order[-1]] = True
+    return order
+
+
+def stream_image(file, bands, width, height, *, color_table=None, band_rows=64) -> int:
+    """
+    Writes a single-image GIF to the binary `file` without ever holding
+    more than one band of rows of it in memory: pixels are mapped to
+    color indices band by band, the LZW state carries across bands,
+    and image data is written out as each sub-block fills up.
+    
+    `bands` is either an iterable of (rows, width, 3) RGB arrays, top
+    to bottom, or a (height, width, 3) array -- e.g. a memmap -- which
+    is read `band_rows` rows at a time.
+    
+    The color table's size can't change once the image data has
+    started, so its colors are found by:
+      - an extra pass over the bands, if `bands` is an array and no
+        `color_table` is given;
+      - otherwise, being added to `color_table` (by default, an empty
+        one with a capacity of 256) as they're encountered. The table
+        then has to have a fixed capacity unless it's complete already,
+        and if it does gain any colors, `file` has to be seekable so
+        that the table can be rewritten afterward.
+    Returns the number of bytes written.
+    """
+    if isinstance(bands, np.ndarray):
+        if bands.shape != (height, width, 3):
+            raise ValueError('Expected an array of shape {}, got {}'.format((height, width, 3), bands.shape))
+        image = bands
+        def read_bands():
+            return (image[idx:idx+band_rows] for idx in range(0, height, band_rows))
+        if color_table is None:
+            color_table = classes.ColorTable()
+            for band in read_bands():
+                colors, _ = find_unique_colors(band)
+                color_table.extend(set(map(tuple, colors)).difference(color_table.underlying))
+        band_stream = read_bands()
+    else:
+        band_stream = iter(bands)
+        if color_table is None:
+            color_table = classes.ColorTable(capacity=256)
+    # a lone color would make for a size of -1; tables hold at least 2 entries
+    if color_table.size() < 0:
+        color_table.ensure_transparent_color()
+    size = color_table.size()
+    written = 0
+    def write(data):
+        nonlocal written
+        written += file.write(data)
+    
+    logical_screen_descriptor = classes.LogicalScreenDescriptor(width, height, background_color_index=0)
+    logical_screen_descriptor.color_field.global_color_table_size = size
+    write(bytes(classes.Header()))
+    write(bytes(logical_screen_descriptor))
+    table_offset = written
+    write(bytes(color_table))
+    write(bytes(classes.ImageDescriptor(width, height)))
+    
+    table_length = color_table.underlying_length()
+    encoder = lzw.Encoder(color_table, write)
+    rows = 0
+    for band in band_stream:
+        band = np.asarray(band)
+        if band.ndim != 3 or band.shape[1:] != (width, 3):
+            raise ValueError('Expected bands of shape (rows, {}, 3), got {}'.format(width, band.shape))
+        colors, inverse = find_unique_colors(band)
+        color_table.extend(set(map(tuple, colors)).difference(color_table.underlying))
+        if color_table.size() != size:
+            raise ValueError('Color table outgrew its original size mid-image; give it a capacity')
+        lut = np.array([color_table[tuple(color)] for color in colors])
+        encoder.feed(lut[inverse].tolist())
+        rows += len(band)
+    if rows != height:
+        raise ValueError('Got {} rows of pixels for an image of height {}'.format(rows, height))
+    encoder.finish()
+    write(b'\x3b')
+    
+    if color_table.underlying_length() != table_length:
+        end = file.tell()
+        file.seek(end - written + table_offset)
+        file.write(bytes(color_table))
+        file.seek(end)
+    return written
+
+
+def changed_regions(changed, tile_size=16) -> list:
+    """
+    Groups the True pixels of a 2D mask into regions: the mask is cut
+    into `tile_size`-square tiles, and each 8-connected group of tiles
+    containing True pixels becomes one region.
+    Returns the regions' tight bounding boxes as (top, left, bottom,
+    right) tuples, ends exclusive.
+    """
+    height, width = changed.shape
+    tile_rows, tile_cols = -(-height // tile_size), -(-width // tile_size)
+    padded = np.zeros((tile_rows * tile_size, tile_cols * tile_size), dtype=bool)
+    padded[:height, :width] = changed
+    tiles = padded.reshape(tile_rows, tile_size, tile_cols, tile_size).any((1, 3))
+    # label components by repeatedly spreading each tile's minimum label to its neighbors
+    unlabeled = tiles.size
+    labels = np.where(tiles, np.arange(tiles.size).reshape(tiles.shape), unlabeled)
+    while True:
+        padded_labels = np.pad(labels, 1, constant_values=unlabeled)
+        spread = labels
+        for dy in range(3):
+            for dx in range(3):
+                spread = np.minimum(spread, padded_labels[dy:dy+tile_rows, dx:dx+tile_cols])
+        spread = np.where(tiles, spread, unlabeled)
+        if (spread == labels).all():
+            break
+        labels = spread
+    regions = []
+    for label in np.unique(labels[tiles]):
+        component = labels == label
+        rows, cols = np.flatnonzero(component.any(1)), np.flatnonzero(component.any(0))
+        top, left = rows[0] * tile_size, cols[0] * tile_size
+        bottom, right = (rows[-1] + 1) * tile_size, (cols[-1] + 1) * tile_size
+        within = changed[top:bottom, left:right]
+        rows, cols = np.flatnonzero(within.any(1)), np.flatnonzero(within.any(0))
+        regions.append((
+          int(top + rows[0]), int(left + cols[0]),
+          int(top + rows[-1] + 1), int(left + cols[-1] + 1)
+        ))
+    return regions
+
+
+def find_unique_colors(pixels):
+    """
+    Returns the unique colors of an RGB array as an (n, 3) array,
+    along with each pixel's index into them (flattened).
+    This is the costly part of creating a Frame, and touches no
+    shared state, so it can be done ahead of time and off-thread.
+    Each pixel is packed into one uint32 key first: np.unique's
+    axis=0 mode sorts a structured view, which holds the GIL.
+    """
+    flat = pixels.reshape(-1, 3).astype(np.uint32)
+    keys = flat[:, 0] << 16 | flat[:, 1] << 8 | flat[:, 2]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    colors = np.empty((len(keys), 3), dtype=pixels.dtype)
+    colors[:, 0] = keys >> 16
+    colors[:, 1] = keys >> 8 & 0xff
+    colors[:, 2] = keys & 0xff
+    return colors, inverse.reshape(-1)
+
+
+def unchanged_mask(pixels, reference, tolerance=0, metric='channel'):
+    """
+    Returns a boolean mask of which RGB `pixels` are within `tolerance`
+    of the same-shaped `reference`. `metric` is one of:
+        'channel': no channel differs by more than `tolerance`
+        'perceptual': "redmean"-weighted Euclidean distance of at
+          most `tolerance` (roughly 0-765)
+    """
+    if metric not in ('channel', 'perceptual'):
+        raise ValueError('Invalid metric {!r}'.format(metric))
+    if not tolerance:
+        return (pixels == reference).all(2)
+    diff = pixels.astype(np.int32) - reference
+    if metric == 'channel':
+        return (np.abs(diff) <= tolerance).all(2)
+    redmean = (pixels[..., 0].astype(np.int32) + reference[..., 0]) // 2
+    weights = np.stack([512 + redmean, np.full_like(redmean, 1024), 767 - redmean], axis=-1)
+    return ((weights * diff * diff).sum(2) >> 8) <= tolerance * tolerance
 
 
 @util.proxy('slots', image_descriptor=classes.ImageDescriptor)
@@ -112,26 +805,31 @@ class Frame:
       color_indices=None,
       delay_time=None,
       transparent_color_index=None,
+      unique_colors=None,
     ):
         self.gif = gif
         if not isinstance(pixels, np.ndarray):
             pixels = np.array(pixels)
         self._color_table = color_table
         self.pixels = pixels
-        self.colors = set(map(tuple, np.unique(self.pixels.reshape(-1, 3), axis=0)))
+        if unique_colors is None:
+            unique_colors = find_unique_colors(pixels)
+        colors, inverse = unique_colors
+        self.colors = set(map(tuple, colors))
+        # reserved before the table's size is recorded, since the GCE below needs it anyway
+        self.color_table.ensure_transparent_color()
         self.update_color_table()
         if color_indices is None:
             _ctable = self.color_table
-            color_indices = np.apply_along_axis(
-              lambda color: _ctable[tuple(color)],
-              2,
-              pixels
-            )
+            lut = np.array([_ctable[tuple(color)] for color in colors])
+            color_indices = lut[inverse].reshape(pixels.shape[:2])
         self.color_indices = color_indices
-        self.image_descriptor = classes.ImageDescriptor(*self.color_indices.shape)
+        self.image_descriptor = classes.ImageDescriptor(*reversed(self.color_indices.shape))
+        # a None transparent index follows the color table's, which moves as it grows
+        self._auto_transparent_color_index = transparent_color_index is None
         self._graphic_control_extension = classes.GraphicControlExtension(
           self.gif.global_delay_time if delay_time is None else delay_time,
-          transparent_color_index
+          self.color_table.transparent_color_index if transparent_color_index is None else transparent_color_index
         )
         self.use_graphic_control_extension = use_graphic_control_extension or color_table is not None
     
@@ -143,26 +841,110 @@ class Frame:
     def __imod__(self, other):
         if not isinstance(other, Frame):
             return NotImplemented
-        # TODO: use self.pixels and classes.ColorTable.TRANSPARENT here instead
-        transparent = self.color_table.transparent_color_index
-        self.color_indices[self == other] = transparent
-        eq = self.color_indices == transparent
-        # argmin() gets the first False value's index,
-        # aka the number of starting Trues to erase
-        cols, rows = eq.all(0).argmin(), eq.all(1).argmin()
-        self.color_indices = self.color_indices[rows:, cols:]
-        self.pixels = self.pixels[rows:, cols:]
-        self.left = cols
-        self.top = rows
+        self.erase(self == other)
         return self
     
+    def erase(self, mask):
+        """
+        Makes this frame's pixels where `mask` is True transparent,
+        then crops it to the bounding box of the remaining ones (or a
+        single pixel, if none remain)
+        """
+        # resolved to an actual index only on encoding, since the table's can still move
+        self.color_indices = np.where(mask, self.color_table[classes.ColorTable.TRANSPARENT], self.color_indices)
+        rows, cols = np.flatnonzero(~mask.all(1)), np.flatnonzero(~mask.all(0))
+        if not rows.size:
+            rows = cols = np.zeros(1, dtype=int)
+        top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        self.color_indices = self.color_indices[top:bottom, left:right]
+        self.pixels = self.pixels[top:bottom, left:right]
+        self.left += int(left)
+        self.top += int(top)
+        self.height, self.width = self.color_indices.shape
+        # transparency needs the GCE
+        self.use_graphic_control_extension = True
+    
+    def crop(self, top, left, bottom, right):
+        """
+        Returns a new frame holding just the given part of this one
+        (coordinates relative to this frame, ends exclusive), with the
+        same color table and graphic-control settings
+        """
+        part = copy.copy(self)
+        part.pixels = self.pixels[top:bottom, left:right]
+        part.color_indices = self.color_indices[top:bottom, left:right]
+        part.image_descriptor = classes.ImageDescriptor(right - left, bottom - top, self.left + left, self.top + top)
+        part.color_field = self.color_field
+        part._graphic_control_extension = copy.deepcopy(self._graphic_control_extension)
+        return part
+    
+    def split(self, tile_size=16) -> list:
+        """
+        Splits this frame's non-transparent pixels into one frame per
+        region found by `changed_regions()`, if that's estimated to
+        encode smaller than the frame as a whole; otherwise returns
+        [self]. All but the last part get a delay of 0, so the parts
+        are displayed together (although some viewers do enforce a
+        minimum delay).
+        """
+        changed = self.color_indices != self.color_table[classes.ColorTable.TRANSPARENT]
+        regions = changed_regions(changed, tile_size)
+        if len(regions) < 2:
+            return [self]
+        parts = [self.crop(*region) for region in regions]
+        for part in parts:
+            part.use_graphic_control_extension = True
+        for part in parts[:-1]:
+            part.delay_time = 0
+        if sum(part.estimate_size() for part in parts) >= self.estimate_size():
+            return [self]
+        return parts
+    
     def __bytes__(self):
-        ba = bytearray()
-        if self.use_graphic_control_extension:
-            ba.extend(bytes(self._graphic_control_extension))
-        ba.extend(bytes(self.image_descriptor))
-        ba.extend(lzw.compress(self.color_indices.flat, self.color_table))
-        return bytes(ba)
+        return b''.join(self.blocks())
+    
+    def blocks(self) -> list:
+        blocks = self._header_blocks()
+        indices = self._encodable_indices()
+        frame_cache = cache.active()
+        if frame_cache is None:
+            blocks.append(lzw.compress(indices.flat, self.color_table))
+        else:
+            key = frame_cache.key(indices, self.color_table, (self.left, self.top, self.width, self.height))
+            blocks.append(frame_cache.get_or_encode(key, lambda: lzw.compress(indices.flat, self.color_table)))
+        return blocks
+    
+    def estimate_size(self) -> int:
+        """
+        Returns the exact length of bytes(self) without building the
+        LZW output (see lzw.compressed_size())
+        """
+        return util.blocks_size(self._header_blocks()) + lzw.compressed_size(self._encodable_indices().flat, self.color_table)
+    
+    def _encodable_indices(self):
+        """
+        Color indices with ColorTable.TRANSPARENT's placeholder index
+        swapped for the real one.
+        Call after _header_blocks(), which updates the latter.
+        """
+        transparent = self.color_table[classes.ColorTable.TRANSPARENT]
+        return np.where(self.color_indices == transparent, self.transparent_color_index, self.color_indices)
+    
+    def _header_blocks(self) -> list:
+        blocks = []
+        if self._auto_transparent_color_index:
+            self.transparent_color_index = self.color_table.transparent_color_index
+        # a GCE only applies to the image right after it, so any delay needs one per frame
+        if self.use_graphic_control_extension or self.delay_time:
+            blocks.append(bytes(self._graphic_control_extension))
+        if self._color_table is None:
+            blocks.append(bytes(self.image_descriptor))
+        else:
+            self.color_field.has_local_color_table = True
+            self.color_field.local_color_table_size = self.color_table.size()
+            blocks.append(bytes(self.image_descriptor))
+            blocks.append(bytes(self.color_table))
+        return blocks
     
     @property
     def color_table(self):
@@ -178,5 +960,3 @@ class Frame:
         self.color_table.extend(self.colors.difference(self.color_table.underlying))
         if self._color_table is None:
             self.gif.update_color_table_size()
-        else:
-            self.local_color_table_size = self.color_table.size
@@ -13,10 +13,23 @@ class BitStream:
         self._out = bytearray()
     
     def __bytes__(self):
-        if self._buffer:
+        while self._buffer:
             self._consume_byte()
         return bytes(self._out)
     
+    def __len__(self):
+        return len(self._out) + (len(self._buffer) + 7) // 8
+    
+    def drain(self, size=255) -> bytes:
+        """
+        Removes and returns as many complete `size`-byte chunks of
+        output as are ready
+        """
+        end = len(self._out) // size * size
+        data = bytes(self._out[:end])
+        del self._out[:end]
+        return data
+    
     def _consume_byte(self):
         """
         Consumes one byte from the buffer and appends it to the output stream
@@ -33,29 +46,46 @@ class BitStream:
             self._buffer.append(n % 2)
             n //= 2
         self._buffer.extend(repeat(0, fill))
-        if len(self._buffer) >= 8:
+        while len(self._buffer) >= 8:
             self._consume_byte()
 
 
+class BitCounter:
+    """
+    Stands in for a BitStream when only the length of the output is
+    needed: codes are counted, never stored
+    """
+    def __init__(self):
+        self.bits = 0
+    
+    def __len__(self):
+        return (self.bits + 7) // 8
+    
+    def append(self, n, code_size):
+        self.bits += code_size
+
+
 class CodeTable:
     MAX_CODE_SIZE = 12
     
-    def __init__(self, color_table):
-        self._d = {}
+    def __init__(self, color_table, out=None):
         self.min_code_size = max(2, min(self.MAX_CODE_SIZE, 1 + color_table.size()))
-        self._code_size = self._first_code_size = 1 + self.min_code_size
+        self._first_code_size = 1 + self.min_code_size
         self._max_code = 2 ** self.min_code_size - 1
         self._clear = 1 + self._max_code
         self._eoi = 1 + self._clear
-        self._cur_code = 1 + self._eoi
-        self._codes_used = set()
-        for color_code in range(self._cur_code):
-            self[color_code,] = color_code
-        self.out = BitStream()
+        self.out = BitStream() if out is None else out
+        self.reset()
     
     def __bytes__(self):
         return self.min_code_size.to_bytes(1, 'little') + util.subblockify(bytes(self.out))
     
+    def encoded_size(self):
+        """
+        Returns the length of what __bytes__() would return
+        """
+        return 1 + util.subblocked_size(len(self.out))
+    
     def __contains__(self, key):
         return self._d.__contains__(key)
     
@@ -66,12 +96,24 @@ class CodeTable:
         self._codes_used.add(value)
         if value == 2 ** self._code_size:
             if self._code_size == self.MAX_CODE_SIZE:
+                # table's full: tell the decoder to start over, and do the same
                 self.clear()
-                self._code_size = self._first_code_size
-            else:
-                self._code_size += 1
+                self.reset()
+                return
+            self._code_size += 1
         self._d.__setitem__(key, value)
     
+    def reset(self):
+        """
+        (Re)initializes the table to contain only the single-index codes
+        """
+        self._d = {}
+        self._code_size = self._first_code_size
+        self._cur_code = 1 + self._eoi
+        self._codes_used = set()
+        for color_code in range(self._cur_code):
+            self[color_code,] = color_code
+    
     def add(self, indices):
         self[indices] = self._cur_code
         while self._cur_code in self._codes_used:
@@ -98,10 +140,72 @@ def compress(color_indices, color_table, code_table=None) -> bytes:
     """
     if code_table is None:
         code_table = CodeTable(color_table)
-    # XXX: all this tuple stuff feels really inefficient
+    _encode(color_indices, code_table)
+    return bytes(code_table)
+
+
+def compressed_size(color_indices, color_table) -> int:
+    """
+    Dry run of compress(): returns the length of what it would return
+    without building any output
+    """
+    code_table = CodeTable(color_table, out=BitCounter())
+    _encode(color_indices, code_table)
+    return code_table.encoded_size()
+
+
+class Encoder:
+    """
+    Incrementally LZW-compresses GIF colors: indices are `feed()`-ed in
+    any number of chunks, with the code table carrying across them, and
+    sub-blocks are passed to `write` as soon as they fill up rather than
+    being kept around. Call `finish()` after the last chunk.
+
+    The color table's size must not change once encoding has started.
+    """
+    def __init__(self, color_table, write):
+        self.code_table = CodeTable(color_table)
+        self._write = write
+        self._idx_buffer = None
+        write(self.code_table.min_code_size.to_bytes(1, 'little'))
+        self.code_table.clear()
+    
+    def feed(self, color_indices):
+        idx_stream = iter(color_indices)
+        if self._idx_buffer is None:
+            for k in idx_stream:
+                self._idx_buffer = k,
+                break
+            else:
+                return
+        self._idx_buffer = _feed(idx_stream, self.code_table, self._idx_buffer)
+        data = self.code_table.out.drain(255)
+        if data:
+            self._write(util.subblockify(data, terminate=False))
+    
+    def finish(self):
+        if self._idx_buffer is not None:
+            self.code_table.output(self._idx_buffer)
+        self.code_table.eoi()
+        data = bytes(self.code_table.out)
+        self._write(util.subblockify(data) if data else b'\x00')
+
+
+def _encode(color_indices, code_table):
     idx_stream = iter(color_indices)
     idx_buffer = next(idx_stream),
     code_table.clear()
+    idx_buffer = _feed(idx_stream, code_table, idx_buffer)
+    code_table.output(idx_buffer)
+    code_table.eoi()
+
+
+def _feed(idx_stream, code_table, idx_buffer):
+    """
+    Runs the LZW loop over `idx_stream`, starting from (and returning)
+    the pending run of indices `idx_buffer`
+    """
+    # XXX: all this tuple stuff feels really inefficient
     for k in idx_stream:
         if (*idx_buffer, k) in code_table:
             idx_buffer += k,
@@ -109,6 +213,4 @@ def compress(color_indices, color_table, code_table=None) -> bytes:
         code_table.output(idx_buffer)
         code_table.add((*idx_buffer, k))
         idx_buffer = k,
-    code_table.output(idx_buffer)
-    code_table.eoi()
-    return bytes(code_table)
+    return idx_buffer
@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+
+import numpy as np
+
+from . import core
+
+
+class Ingestor:
+    """
+    Thread-safe pipeline for feeding frames into a core.GIF from
+    several producer threads.
+
+    Producers `submit()` raw RGB arrays; a pool of worker threads
+    finds each one's unique colors (the NumPy-heavy part of creating
+    a Frame, which releases the GIL), and a single committer thread
+    then updates the GIF's color table, maps pixels to indices, and
+    appends frames strictly in the order they were submitted.
+    At most `max_pending` frames are in flight at once: `submit()`
+    blocks until one is committed if that many already are.
+
+    If `diff` is true, frames are difference-compressed (see
+    core.GIF.difference_compress()) as they're committed.
+    """
+    def __init__(self,
+      gif,
+      workers: int = None,
+      max_pending: int = None,
+      *,
+      diff: bool = False,
+      tolerance: int = 0,
+      metric: str = 'channel'
+    ):
+        self.gif = gif
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_pending is None:
+            max_pending = 2 * workers
+        self.diff = diff
+        self.tolerance = tolerance
+        self.metric = metric
+        self._canvas = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._ready = {}
+        self._next_seq = 0
+        self._next_commit = 0
+        self._closed = False
+        self._error = None
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        self._committer = threading.Thread(target=self._commit_loop, daemon=True)
+        for thread in (*self._workers, self._committer):
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, pixels, delay_time=None) -> int:
+        """
+        Queues `pixels` to become the GIF's next frame, blocking while
+        `max_pending` frames are already in flight.
+        Returns the frame's sequence number.
+        """
+        self._raise_if_failed()
+        self._slots.acquire()
+        with self._cond:
+            if self._closed:
+                self._slots.release()
+                raise ValueError('Cannot submit to a closed Ingestor')
+            seq = self._next_seq
+            self._next_seq += 1
+            # enqueued under the lock so close() can't slip its sentinels in ahead
+            self._queue.put((seq, np.asarray(pixels), delay_time))
+        return seq
+
+    def close(self):
+        """
+        Waits for every submitted frame to be committed and stops the
+        pipeline's threads, re-raising the first error any frame hit
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        for _ in self._workers:
+            self._queue.put(None)
+        for thread in (*self._workers, self._committer):
+            thread.join()
+        self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError('Frame ingestion failed') from self._error
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            seq, pixels, delay_time = item
+            try:
+                result = pixels, delay_time, core.find_unique_colors(pixels)
+            except BaseException as e:
+                result = e
+            with self._cond:
+                self._ready[seq] = result
+                self._cond.notify_all()
+
+    def _commit_loop(self):
+        while True:
+            with self._cond:
+                while self._next_commit not in self._ready:
+                    if self._closed and self._next_commit == self._next_seq:
+                        return
+                    self._cond.wait()
+                result = self._ready.pop(self._next_commit)
+                self._next_commit += 1
+            # after a failure, frames are still drained so that producers can't deadlock
+            if self._error is None:
+                try:
+                    if isinstance(result, BaseException):
+                        raise result
+                    self._commit(*result)
+                except BaseException as e:
+                    self._error = e
+            self._slots.release()
+
+    def _commit(self, pixels, delay_time, unique_colors):
+        frame = self.gif.create_frame(pixels, delay_time, unique_colors=unique_colors)
+        self.gif.append(frame)
+        if self.diff:
+            if self._canvas is None:
+                self._canvas = core.Canvas(self.gif.canvas_width, self.gif.canvas_height, pixels.dtype)
+            self._canvas.difference_compress(frame, self.tolerance, self.metric)
@@ -1,7 +1,14 @@
-import inspect
-from functools import partial, reduce, wraps
+import os
+from functools import reduce
 from operator import attrgetter
 
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = -1
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
+
 
 def next_po2(n) -> int:
     """
@@ -45,20 +52,81 @@ def subblockify(data: bytes, terminate: bool = True) -> bytes:
     Properly segments data into 255-byte-max sub-blocks.
     `terminate` indicates whether to end with a 0x00 terminator.
     """
-    # TODO: make less inefficient.
-    ba, idx = bytearray(), 0
-    # insert 0xff byte before every 255-byte run
-    for idx in range(255, len(data), 255):
-        ba.append(255)
-        ba.extend(data[idx-255:idx])
-    # insert amount of remaining bytes
-    ba.append(len(data) if len(data) < 255 else len(data) - idx)
-    ba.extend(data[idx:])
-    if terminate:
-        ba.append(0x00)
+    data = memoryview(data).cast('B')
+    full, rest = divmod(len(data), 255)
+    ba = bytearray(subblocked_size(len(data), terminate))
+    pos = 0
+    for idx in range(0, 255 * full, 255):
+        ba[pos] = 255
+        ba[pos+1:pos+256] = data[idx:idx+255]
+        pos += 256
+    if rest or not full:
+        ba[pos] = rest
+        ba[pos+1:pos+1+rest] = data[255*full:]
+    # terminator byte is already 0x00
     return bytes(ba)
 
 
+def subblocked_size(length: int, terminate: bool = True) -> int:
+    """
+    Returns the length of subblockify()'s output for `length` bytes of data
+    """
+    full, rest = divmod(length, 255)
+    # every sub-block gets a length byte; a trailing partial (or empty) one is always emitted
+    return length + full + (rest > 0 or not full) + terminate
+
+
+def blocks_size(blocks) -> int:
+    """
+    Returns the total length in bytes of a sequence of bytes-like blocks
+    """
+    return sum(memoryview(block).nbytes for block in blocks)
+
+
+def write_blocks_into(blocks, buffer, offset: int = 0) -> int:
+    """
+    Copies each of `blocks` back-to-back into the writable `buffer`
+    (bytearray, memoryview, mmap...) starting at `offset`, without any
+    intermediate joining.
+    Returns the number of bytes written.
+    """
+    view = memoryview(buffer).cast('B')
+    size = blocks_size(blocks)
+    if offset + size > len(view):
+        raise ValueError('Buffer too small: need {} bytes past offset {}, have {}'.format(
+          size, offset, len(view) - offset
+        ))
+    for block in blocks:
+        block = memoryview(block).cast('B')
+        view[offset:offset+len(block)] = block
+        offset += len(block)
+    return size
+
+
+def writev_blocks(fd: int, blocks) -> int:
+    """
+    Writes each of `blocks` to file descriptor `fd` using os.writev()
+    (or os.write() where unavailable), retrying on partial writes.
+    Returns the number of bytes written.
+    """
+    pending = [memoryview(block).cast('B') for block in blocks]
+    pending = [block for block in pending if block]
+    total = 0
+    writev = getattr(os, 'writev', None)
+    while pending:
+        if writev is None:
+            written = os.write(fd, pending[0])
+        else:
+            written = writev(fd, pending[:_IOV_MAX])
+        total += written
+        # drop fully-written blocks, then trim a partially-written one
+        while pending and written >= len(pending[0]):
+            written -= len(pending.pop(0))
+        if written:
+            pending[0] = pending[0][written:]
+    return total
+
+
 def check_null_slots(obj) -> None:
     for attr in obj.__slots__:
         if getattr(obj, attr) is None:
@@ -73,65 +141,44 @@ def proxy(*what, **kwargs):
         {attr name : attr's expected type}
     Positional args consist of the strings 'properties' and 'slots',
     whose presence indicates that they should be proxied.
+
+    Getters are plain attrgetters, so e.g. `frame.left` doesn't go
+    through any Python-level call at all.
     """
     what = set(map(str.casefold, what))
     slots, properties = 'slots' in what, 'properties' in what
     def inner(cls):
         for attr_name, attr_cls in kwargs.items():
             if properties:
-                for proxied_prop_name, proxied_prop in inspect.getmembers(attr_cls, property.__instancecheck__):
-                    setattr(cls, proxied_prop_name, property(
-                        transformative_partial(proxied_prop.__get__, attrgetter(attr_name)),
-                        transformative_partial(proxied_prop.__set__, attrgetter(attr_name), None),
-                        transformative_partial(proxied_prop.__delete__, attrgetter(attr_name))
-                    ))
+                for proxied_prop_name in _properties_of(attr_cls):
+                    setattr(cls, proxied_prop_name, _make_proxy(attr_name, proxied_prop_name))
             if slots:
                 for proxied_attr in getattr(attr_cls, '__slots__', ()):
-                    setattr(cls, proxied_attr, property(
-                      partial(_proxy_getf, attr_name, proxied_attr),
-                      partial(_proxy_setf, attr_name, proxied_attr),
-                      partial(_proxy_delf, attr_name, proxied_attr),
-                    ))
+                    setattr(cls, proxied_attr, _make_proxy(attr_name, proxied_attr))
         return cls
     return inner
 
 
-def transformative_partial(func, *transformers, **kw_transformers):
+def _properties_of(cls):
     """
-    Each argument given should line up with a parameter of `func`. If not None,
-    it will be called on the corresponding argument of `func` before said argument
-    is passed to it.
-    
-    After I wrote this I realized it was basically a worse (but syntactically
-    less-hacky) version of the typehint transformer I use in ergo. May replace
-    this with that later.
+    Yields the names of all properties defined on `cls` or its bases
     """
-    if not callable(func):
-        raise TypeError('First argument must be callable')
-    if not all(map(callable, {*transformers, *kw_transformers.values()} - {None})):
-        raise ValueError('All transformers must be callable or None')
-    #TODO: check varargs' lengths against number of params func takes
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        args = [
-          arg if transformer is None else transformer(arg)
-          for transformer, arg in zip(transformers, args)
-        ]
-        kwargs = {
-          name: arg if transformer is None else transformer(arg)
-          for transformer, name, arg in zip(kw_transformers, kwargs.keys(), kwargs.values())
-        }
-        return func(*args, **kwargs)
-    return wrapper
-
+    seen = set()
+    for klass in cls.__mro__:
+        for name, value in vars(klass).items():
+            if name not in seen and isinstance(value, property):
+                yield name
+            seen.add(name)
 
-def _proxy_getf(attr_name, proxied_attr, self):
-    return getattr(getattr(self, attr_name), proxied_attr)
 
-
-def _proxy_setf(attr_name, proxied_attr, self, value):
-    setattr(getattr(self, attr_name), proxied_attr, value)
-
-
-def _proxy_delf(attr_name, proxied_attr, self):
-    delattr(getattr(self, attr_name), proxied_attr)
+def _make_proxy(attr_name, proxied_attr) -> property:
+    """
+    Returns a property forwarding to `self.<attr_name>.<proxied_attr>`.
+    The getter is a bare (C-level) attrgetter; the setter and deleter
+    are single closures.
+    """
+    def fset(self, value):
+        setattr(getattr(self, attr_name), proxied_attr, value)
+    def fdel(self):
+        delattr(getattr(self, attr_name), proxied_attr)
+    return property(attrgetter(attr_name + '.' + proxied_attr), fset, fdel)